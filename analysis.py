@@ -1,6 +1,7 @@
 from pathlib import Path
 
 from .read_nda import read_file
+from .prefetch import FilePrefetcher, DEFAULT_READAHEAD_BYTES
 import os
 import time
 import numpy as np
@@ -9,13 +10,22 @@ import pandas as pd
 
 class Dataset:
 
-    def __init__(self, file_paths, active_mass_g=None, design_capacity_Ah=None, rated_capacity_Ah=None, upper_voltage_limit=None, lower_voltage_limit=None):
+    def __init__(self, file_paths, active_mass_g=None, design_capacity_Ah=None, rated_capacity_Ah=None, upper_voltage_limit=None, lower_voltage_limit=None, readahead_bytes=DEFAULT_READAHEAD_BYTES, prefetcher=None):
         file_paths = [file_paths] if isinstance(file_paths, str) else file_paths
         self.file_paths = file_paths
 
+        # read the next files in the background while the current one is decoded
+        own_prefetcher = prefetcher is None
+        if own_prefetcher:
+            prefetcher = FilePrefetcher(file_paths, readahead_bytes=readahead_bytes)
+
         ec_data_dict = {}
-        for file_path in file_paths:
-            ec_data_dict[os.path.basename(file_path)] = read_file(file_path)
+        try:
+            for file_path in file_paths:
+                ec_data_dict[os.path.basename(file_path)] = read_file(file_path, file_bytes=prefetcher.get(file_path))
+        finally:
+            if own_prefetcher:
+                prefetcher.close()
 
         self.ec_data = ec_data_dict
         self.ec_data_display = ec_data_dict
@@ -405,7 +415,7 @@ class Dataset:
         return
 
 
-def bulk_load(data_dir, battery_df, merge=False, steps_filters=None, cycle_filters=None, change_units=False):
+def bulk_load(data_dir, battery_df, merge=False, steps_filters=None, cycle_filters=None, change_units=False, readahead_bytes=DEFAULT_READAHEAD_BYTES, store=None):
     grouped_file_paths = {}
     all_data = {}
     for root, subdirs, files in os.walk(data_dir):
@@ -423,24 +433,32 @@ def bulk_load(data_dir, battery_df, merge=False, steps_filters=None, cycle_filte
                         'file_paths': [file_path, ]
                     }
 
-    for battery_id, battery_data in grouped_file_paths.items():
-        my_battery = Dataset(battery_data['file_paths'],  active_mass_g=battery_data['active_mass'])
+    # one prefetcher across all batteries so the next battery's files load while the current one is analyzed
+    all_file_paths = [file_path for battery_data in grouped_file_paths.values() for file_path in battery_data['file_paths']]
+    with FilePrefetcher(all_file_paths, readahead_bytes=readahead_bytes) as prefetcher:
+        for battery_id, battery_data in grouped_file_paths.items():
+            my_battery = Dataset(battery_data['file_paths'],  active_mass_g=battery_data['active_mass'], prefetcher=prefetcher)
+
+            if merge:
+                my_battery.merge()
 
-        if merge:
-            my_battery.merge()
+            my_battery.analyze()
 
-        my_battery.analyze()
+            if steps_filters:
+                my_battery.filter_step_data(steps_filters)
 
-        if steps_filters:
-            my_battery.filter_step_data(steps_filters)
+            if cycle_filters:
+                my_battery.filter_cycle_data(cycle_filters)
 
-        if cycle_filters:
-            my_battery.filter_cycle_data(cycle_filters)
+            if change_units:
+                my_battery.change_units()
 
-        if change_units:
-            my_battery.change_units()
+            all_data[battery_id] = my_battery.ec_data_display
 
-        all_data[battery_id] = my_battery.ec_data_display
+            # persist summaries so fleet queries don't need to reload every .nda file
+            if store is not None:
+                store.upsert_battery(battery_id, my_battery.ec_data_display, group_name=battery_data['group_name'],
+                                     test_plan=battery_data['test_plan'], active_mass_g=battery_data['active_mass'])
 
     return all_data
 
@@ -0,0 +1,241 @@
+import numpy as np
+import pandas as pd
+
+
+MODEL_NAMES = ['linear', 'sqrt', 'power']
+
+# models fitted directly on capacity; their r2 values are comparable and used to pick best_model
+Q_SPACE_MODELS = ['linear', 'sqrt']
+
+# running sums kept per cell and model: count, sum x, sum y, sum x^2, sum xy, sum y^2
+N_STATS = 6
+
+
+def pack_cycle_series(all_data, column='normalized_dchg', file_name=None):
+    # Pack every battery's cycle series from bulk_load output into NaN-padded 2D arrays.
+    # Uses each battery's last file (merged_data if merged) unless file_name is given; the file used
+    # is returned per battery so FadeFitter can tell when a battery's source changed.
+    battery_ids = []
+    sources = []
+    series = []
+    for battery_id, battery_data in all_data.items():
+        key = file_name if file_name is not None else list(battery_data.keys())[-1]
+        cycle_data = battery_data.get(key, {}).get('cycle_data')
+        if cycle_data is None or column not in cycle_data.columns:
+            continue
+        battery_ids.append(battery_id)
+        sources.append(key)
+        series.append((cycle_data.index.to_numpy(dtype=float), cycle_data[column].to_numpy(dtype=float)))
+
+    max_len = max((len(cycles) for cycles, values in series), default=0)
+    cycles = np.full((len(series), max_len), np.nan)
+    values = np.full((len(series), max_len), np.nan)
+    for i, (cell_cycles, cell_values) in enumerate(series):
+        cycles[i, :len(cell_cycles)] = cell_cycles
+        values[i, :len(cell_values)] = cell_values
+
+    return battery_ids, cycles, values, sources
+
+
+def transform(model, cycles, values):
+    # Each model is linearized to y = a + b * x so all of them share one closed-form least-squares solve.
+    #   linear: q = a + b * n
+    #   sqrt:   q = a + b * sqrt(n)
+    #   power:  q = 1 - B * n^c, fitted as log(1 - q) = log(B) + c * log(n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if model == 'linear':
+            x, y = cycles, values
+        elif model == 'sqrt':
+            x, y = np.sqrt(cycles), values
+        elif model == 'power':
+            x, y = np.log(cycles), np.log(1 - values)
+        else:
+            raise KeyError(f'unknown fade model: {model}')
+
+    valid = np.isfinite(x) & np.isfinite(y) & (cycles > 0)
+    return np.where(valid, x, 0), np.where(valid, y, 0), valid
+
+
+def series_stats(model, cycles, values):
+    x, y, valid = transform(model, cycles, values)
+    return np.stack([
+        valid.sum(axis=1),
+        x.sum(axis=1),
+        y.sum(axis=1),
+        (x * x).sum(axis=1),
+        (x * y).sum(axis=1),
+        (y * y).sum(axis=1),
+    ], axis=1)
+
+
+def solve_stats(stats):
+    n, sx, sy, sxx, sxy, syy = stats.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        denom = n * sxx - sx * sx
+        b = np.where(np.abs(denom) > 1e-12, (n * sxy - sx * sy) / denom, np.nan)
+        a = (sy - b * sx) / n
+
+        sse = syy - 2 * a * sy - 2 * b * sxy + a * a * n + 2 * a * b * sx + b * b * sxx
+        sst = syy - sy * sy / n
+        r2 = np.where(sst > 0, 1 - sse / sst, np.nan)
+        rmse = np.sqrt(np.maximum(sse, 0) / n)
+
+    return a, b, r2, rmse
+
+
+def cycles_to_threshold(model, a, b, threshold):
+    # NaN when the fit never reaches the threshold, or only reached it before cycle 0
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        if model == 'linear':
+            eol = np.where(b < 0, (threshold - a) / b, np.nan)
+            eol = np.where(eol >= 0, eol, np.nan)
+        elif model == 'sqrt':
+            root = (threshold - a) / b
+            eol = np.where((b < 0) & (root >= 0), root ** 2, np.nan)
+        elif model == 'power':
+            eol = np.where(b > 0, np.exp((np.log(1 - threshold) - a) / b), np.nan)
+        else:
+            raise KeyError(f'unknown fade model: {model}')
+
+    return eol
+
+
+class FadeFitter:
+    # Fits capacity-fade models for many cells at once from running sums, so new cycles can be added
+    # incrementally without refitting old ones. Cost is linear in the total number of cycles.
+    # The last cycle of a series is usually still running, so its contribution is kept apart, replaced on
+    # every update and left out of results() unless include_trailing=True; it is committed once a later cycle exists.
+
+    def __init__(self, models=MODEL_NAMES, threshold=0.8):
+        for model in models:
+            if model not in MODEL_NAMES:
+                raise KeyError(f'unknown fade model: {model}')
+        self.models = list(models)
+        self.threshold = threshold
+
+        self.battery_ids = []
+        self._index = {}
+        self._sources = np.empty(0, dtype=object)
+        self._committed_cycle = np.empty(0)
+        self._last_cycle = np.empty(0)
+        self._stats = {model: np.empty((0, N_STATS)) for model in self.models}
+        self._tail = {model: np.empty((0, N_STATS)) for model in self.models}
+
+    def _rows(self, battery_ids):
+        if len(set(battery_ids)) != len(battery_ids):
+            raise ValueError('battery_ids must be unique within one update')
+
+        new_ids = [battery_id for battery_id in battery_ids if battery_id not in self._index]
+        for battery_id in new_ids:
+            self._index[battery_id] = len(self.battery_ids)
+            self.battery_ids.append(battery_id)
+
+        if new_ids:
+            self._sources = np.concatenate([self._sources, np.full(len(new_ids), None, dtype=object)])
+            self._committed_cycle = np.concatenate([self._committed_cycle, np.full(len(new_ids), -np.inf)])
+            self._last_cycle = np.concatenate([self._last_cycle, np.full(len(new_ids), -np.inf)])
+            for model in self.models:
+                self._stats[model] = np.concatenate([self._stats[model], np.zeros((len(new_ids), N_STATS))])
+                self._tail[model] = np.concatenate([self._tail[model], np.zeros((len(new_ids), N_STATS))])
+
+        return np.array([self._index[battery_id] for battery_id in battery_ids], dtype=int)
+
+    def update(self, battery_ids, cycles, values, sources=None):
+        # cycles and values are (cells, max_cycles) arrays padded with NaN, as returned by pack_cycle_series.
+        # Either pass the full series again (committed cycles are skipped, the trailing cycle is replaced) or only
+        # the cycles after the last one seen, in which case the stored trailing cycle is committed as it was.
+        # A cell is refitted from scratch when its source changes or its cycle ids restart.
+        rows = self._rows(list(battery_ids))
+        if len(rows) == 0:
+            return self
+
+        cycles = np.asarray(cycles, dtype=float)
+        values = np.asarray(values, dtype=float)
+
+        finite = np.isfinite(cycles)
+        series_max = np.max(np.where(finite, cycles, -np.inf), axis=1, initial=-np.inf)
+        series_min = np.min(np.where(finite, cycles, np.inf), axis=1, initial=np.inf)
+        has_data = np.isfinite(series_max)
+
+        restart = has_data & (series_max < self._last_cycle[rows])
+        if sources is not None:
+            sources = np.array(sources, dtype=object)
+            previous = self._sources[rows]
+            restart |= has_data & np.array([old is not None and old != new for old, new in zip(previous, sources)], dtype=bool)
+            self._sources[rows[has_data]] = sources[has_data]
+
+        reset_rows = rows[restart]
+        self._committed_cycle[reset_rows] = -np.inf
+        self._last_cycle[reset_rows] = -np.inf
+        for model in self.models:
+            self._stats[model][reset_rows] = 0
+            self._tail[model][reset_rows] = 0
+
+        # only appended cycles were passed, so the previous trailing cycle is final
+        last_cycle = self._last_cycle[rows]
+        appended = has_data & ~restart & np.isfinite(last_cycle) & (series_min > last_cycle)
+        appended_rows = rows[appended]
+        for model in self.models:
+            self._stats[model][appended_rows] += self._tail[model][appended_rows]
+            self._tail[model][appended_rows] = 0
+        self._committed_cycle[appended_rows] = self._last_cycle[appended_rows]
+
+        committed = self._committed_cycle[rows][:, None]
+        with np.errstate(invalid='ignore'):
+            new = (cycles > committed) & (cycles < series_max[:, None])
+            tail = (cycles == series_max[:, None]) & (series_max[:, None] > committed)
+
+        # transform only the columns holding new or trailing cycles, not the whole padded history
+        active_columns = np.flatnonzero((new | tail).any(axis=0))
+        if len(active_columns):
+            window = slice(active_columns[0], active_columns[-1] + 1)
+            cycles, values, new, tail = cycles[:, window], values[:, window], new[:, window], tail[:, window]
+
+            for model in self.models:
+                self._stats[model][rows] += series_stats(model, np.where(new, cycles, np.nan), values)
+                tail_stats = series_stats(model, np.where(tail, cycles, np.nan), values)
+                self._tail[model][rows] = np.where(has_data[:, None], tail_stats, self._tail[model][rows])
+
+        newest_committed = np.max(np.where(new, cycles, -np.inf), axis=1, initial=-np.inf)
+        self._committed_cycle[rows] = np.maximum(self._committed_cycle[rows], newest_committed)
+        self._last_cycle[rows] = np.where(has_data, series_max, self._last_cycle[rows])
+
+        return self
+
+    def update_from_bulk(self, all_data, column='normalized_dchg', file_name=None):
+        return self.update(*pack_cycle_series(all_data, column, file_name))
+
+    def results(self, include_trailing=False):
+        results = pd.DataFrame(index=pd.Index(self.battery_ids, name='battery_id'))
+        results['last_cycle'] = np.where(np.isfinite(self._last_cycle), self._last_cycle, np.nan)
+
+        r2_columns = []
+        for model in self.models:
+            stats = self._stats[model] + self._tail[model] if include_trailing else self._stats[model]
+            a, b, r2, rmse = solve_stats(stats)
+            # the power law is fitted on log(1 - q), so its fit quality is reported in that space
+            suffix = '_log' if model not in Q_SPACE_MODELS else ''
+            results[f'{model}_n'] = stats[:, 0].astype(int)
+            results[f'{model}_a'] = a
+            results[f'{model}_b'] = b
+            results[f'{model}_r2{suffix}'] = r2
+            results[f'{model}_rmse{suffix}'] = rmse
+            results[f'{model}_eol_cycles'] = cycles_to_threshold(model, a, b, self.threshold)
+            if model in Q_SPACE_MODELS:
+                r2_columns.append(f'{model}_r2')
+
+        # best_model only compares models whose r2 is measured on q itself
+        q_models = np.array([model for model in self.models if model in Q_SPACE_MODELS], dtype=object)
+        if len(q_models):
+            r2 = results[r2_columns].to_numpy()
+            has_fit = np.isfinite(r2).any(axis=1)
+            best = np.argmax(np.where(np.isfinite(r2), r2, -np.inf), axis=1)
+            results['best_model'] = np.where(has_fit, q_models[best], None)
+        else:
+            results['best_model'] = None
+
+        return results
+
+
+def fit_fade(all_data, column='normalized_dchg', models=MODEL_NAMES, threshold=0.8, file_name=None, include_trailing=False):
+    return FadeFitter(models, threshold).update_from_bulk(all_data, column, file_name).results(include_trailing)
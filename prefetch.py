@@ -0,0 +1,92 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+DEFAULT_READAHEAD_BYTES = 256 * 1024 * 1024
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def read_chunk(inpath, offset, length):
+    with open(inpath, "rb") as f:
+        f.seek(offset, os.SEEK_SET)
+        return f.read(length)
+
+
+class FilePrefetcher:
+    # Reads upcoming files on background threads while the caller decodes the current one.
+    # Files are expected to be requested with get() in the same order as file_paths.
+    # Large files are split into chunks that are read concurrently, which helps on network shares.
+
+    def __init__(self, file_paths, readahead_bytes=DEFAULT_READAHEAD_BYTES, chunk_bytes=DEFAULT_CHUNK_BYTES, max_workers=4):
+        # pending reads are keyed by path, so each file is only scheduled once
+        self.file_paths = list(dict.fromkeys(file_paths))
+        self.readahead_bytes = readahead_bytes
+        self.chunk_bytes = chunk_bytes
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = OrderedDict()
+        self._queued_bytes = 0
+        self._next = 0
+
+        self._fill()
+
+    def _fill(self):
+        while self._next < len(self.file_paths):
+            file_path = self.file_paths[self._next]
+            try:
+                file_size = os.path.getsize(file_path)
+            except OSError as e:
+                # keep the error with this file so it is raised by get() of this file, not of an earlier one
+                failed = Future()
+                failed.set_exception(e)
+                self._pending[file_path] = (0, [failed])
+                self._next += 1
+                continue
+
+            # always keep at least one file in flight, even if it is larger than the budget
+            if self._pending and self._queued_bytes + file_size > self.readahead_bytes:
+                break
+
+            offsets = list(range(0, file_size, self.chunk_bytes)) or [0]
+            futures = []
+            for i, offset in enumerate(offsets):
+                # read the last chunk to EOF in case the file grew since getsize
+                length = self.chunk_bytes if i < len(offsets) - 1 else -1
+                futures.append(self._executor.submit(read_chunk, file_path, offset, length))
+
+            self._pending[file_path] = (file_size, futures)
+            self._queued_bytes += file_size
+            self._next += 1
+
+    def get(self, file_path):
+        if file_path not in self._pending:
+            # not scheduled (requested out of order or never listed), read it directly
+            return read_chunk(file_path, 0, -1)
+
+        file_size, futures = self._pending.pop(file_path)
+        self._queued_bytes -= file_size
+        self._fill()
+
+        if len(futures) == 1:
+            return futures[0].result()
+        return b''.join(future.result() for future in futures)
+
+    def __iter__(self):
+        for file_path in self.file_paths:
+            yield file_path, self.get(file_path)
+
+    def close(self):
+        for file_size, futures in self._pending.values():
+            for future in futures:
+                future.cancel()
+        self._pending.clear()
+        self._queued_bytes = 0
+        self._next = len(self.file_paths)
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -249,18 +249,18 @@ def process_body_df(body_np, current_limit, debug=False):
     return [main_df, auxt_df]
 
 
-def read_file(inpath, debug=False):
+def read_file(inpath, debug=False, file_bytes=None):
     starttime = time.time()
 
-    with open(inpath, "rb") as f:
-        header_data = f.read()
-        header_size = header_data.find(b'U\x00\x01')
+    # file_bytes lets a caller (e.g. FilePrefetcher) hand over contents it already read in the background
+    if file_bytes is None:
+        with open(inpath, "rb") as f:
+            file_bytes = f.read()
 
-    meta_data = process_header(header_data)
+    header_size = file_bytes.find(b'U\x00\x01')
+    meta_data = process_header(file_bytes)
 
-    with open(inpath, "rb") as f:
-        f.seek(header_size, os.SEEK_SET)
-        body_data = f.read()
+    body_data = memoryview(file_bytes)[header_size:]
 
     body_data_2 = process_body_bytes(body_data, debug)
     body_np = process_body_np(body_data_2, meta_data['current_limit'], debug)
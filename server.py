@@ -0,0 +1,341 @@
+import io
+import json
+import os
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .analysis import Dataset
+
+
+DEFAULT_MAX_MEMORY_BYTES = 4 * 1024 * 1024 * 1024
+DEFAULT_RESCAN_INTERVAL_S = 60
+TABLE_NAMES = ['raw_data', 'auxt_data', 'step_data', 'cycle_data', 'meta_data']
+
+
+class NotFoundError(LookupError):
+    # unknown battery, file, table or column requested by the client, answered with 404
+    pass
+
+
+class BadRequestError(ValueError):
+    # malformed query parameters, answered with 400
+    pass
+
+
+def find_battery_files(data_dir):
+    # same grouping as bulk_load: the first 11 characters of the file name are the battery id
+    battery_files = {}
+    for root, subdirs, files in os.walk(data_dir):
+        for filename in files:
+            if filename[-3:] == 'nda':
+                battery_files.setdefault(filename[:11], []).append(os.path.join(root, filename))
+    return battery_files
+
+
+def dataset_memory_bytes(dataset):
+    total = 0
+    for file_name, file_data in dataset.ec_data.items():
+        for table_name, table_data in file_data.items():
+            if table_name != 'meta_data' and table_data is not None:
+                total += int(table_data.memory_usage(index=True, deep=True).sum())
+    return total
+
+
+def select_table(table_data, columns=None, cycle_min=None, cycle_max=None, start=None, stop=None):
+    if cycle_min is not None or cycle_max is not None:
+        cycle_min = cycle_min if cycle_min is not None else float('-inf')
+        cycle_max = cycle_max if cycle_max is not None else float('inf')
+        if 'cycle_id' in table_data.columns:
+            table_data = table_data[table_data['cycle_id'].between(cycle_min, cycle_max)]
+        elif table_data.index.name == 'cycle_id':
+            table_data = table_data[(table_data.index >= cycle_min) & (table_data.index <= cycle_max)]
+
+    if columns:
+        missing = [column for column in columns if column not in table_data.columns]
+        if missing:
+            raise NotFoundError(f'unknown columns: {missing}')
+        table_data = table_data[columns]
+
+    if start is not None or stop is not None:
+        table_data = table_data.iloc[start:stop]
+
+    return table_data
+
+
+class DatasetCache:
+    # Keeps analyzed Datasets resident, keyed by battery id.
+    # Entries are reloaded when any source .nda mtime changes or files are added for the battery, and
+    # evicted least-recently-used first once the estimated DataFrame memory exceeds max_memory_bytes.
+    # Walking data_dir is slow on network shares, so the directory listing is only refreshed on a cache miss,
+    # a stale entry, or after rescan_interval_s; cache hits only stat the files already known.
+
+    def __init__(self, data_dir, max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES, merge=True, rescan_interval_s=DEFAULT_RESCAN_INTERVAL_S):
+        self.data_dir = data_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.merge = merge
+        self.rescan_interval_s = rescan_interval_s
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._memory_bytes = 0
+        self._battery_files = {}
+        self._scanned_at = None
+
+    def _rescan(self):
+        battery_files = find_battery_files(self.data_dir)
+        with self._lock:
+            self._battery_files = battery_files
+            self._scanned_at = time.monotonic()
+        return battery_files
+
+    def battery_ids(self):
+        return sorted(self._rescan().keys())
+
+    def _file_paths(self, battery_id, rescan=False):
+        with self._lock:
+            battery_files = self._battery_files
+            expired = self._scanned_at is None or time.monotonic() - self._scanned_at >= self.rescan_interval_s
+
+        scanned = rescan or expired or battery_id not in battery_files
+        if scanned:
+            battery_files = self._rescan()
+        if battery_id not in battery_files:
+            raise NotFoundError(f'unknown battery: {battery_id}')
+        return list(battery_files[battery_id]), scanned
+
+    @staticmethod
+    def _mtimes(file_paths):
+        try:
+            return [os.path.getmtime(file_path) for file_path in file_paths]
+        except OSError:
+            return None
+
+    def _load(self, file_paths):
+        mtimes = [os.path.getmtime(file_path) for file_path in file_paths]
+        dataset = Dataset(file_paths)
+        if self.merge and len(file_paths) > 1:
+            dataset.merge()
+        dataset.analyze()
+        return {'dataset': dataset, 'file_paths': file_paths, 'mtimes': mtimes, 'memory_bytes': dataset_memory_bytes(dataset)}
+
+    def get(self, battery_id):
+        file_paths, scanned = self._file_paths(battery_id)
+
+        with self._lock:
+            entry = self._entries.get(battery_id)
+            loading = self._loading.get(battery_id)
+
+        # a load for this battery is already running, share it instead of rescanning
+        if entry is None and loading is not None:
+            return loading.result()
+
+        # stat the files outside the lock so slow shares do not serialize requests for other batteries
+        if entry is not None:
+            current = sorted(entry['file_paths']) == sorted(file_paths) and self._mtimes(entry['file_paths']) == entry['mtimes']
+            if current:
+                with self._lock:
+                    if self._entries.get(battery_id) is entry:
+                        self._entries.move_to_end(battery_id)
+                        return entry['dataset']
+
+        # miss or stale entry: refresh the listing so the load sees every file of the battery
+        if not scanned:
+            file_paths, scanned = self._file_paths(battery_id, rescan=True)
+
+        with self._lock:
+            entry = self._entries.pop(battery_id, None)
+            if entry is not None:
+                self._memory_bytes -= entry['memory_bytes']
+
+            # concurrent requests for the same battery wait on one shared load instead of decoding it again
+            loading = self._loading.get(battery_id)
+            if loading is not None:
+                owner = False
+            else:
+                loading = Future()
+                self._loading[battery_id] = loading
+                owner = True
+
+        if not owner:
+            return loading.result()
+
+        # decode outside the lock so cached batteries can still be served meanwhile
+        try:
+            entry = self._load(file_paths)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[battery_id]
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            previous = self._entries.pop(battery_id, None)
+            if previous is not None:
+                self._memory_bytes -= previous['memory_bytes']
+            self._entries[battery_id] = entry
+            self._memory_bytes += entry['memory_bytes']
+            del self._loading[battery_id]
+
+            # always keep the entry that was just requested, even if it alone exceeds the cap
+            while self._memory_bytes > self.max_memory_bytes and len(self._entries) > 1:
+                evicted_id, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= evicted['memory_bytes']
+
+        loading.set_result(entry['dataset'])
+        return entry['dataset']
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_memory_bytes': self.max_memory_bytes,
+                'memory_bytes': self._memory_bytes,
+                'batteries': {battery_id: entry['memory_bytes'] for battery_id, entry in self._entries.items()},
+            }
+
+
+def to_arrow_bytes(table_data):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise BadRequestError('format=arrow requires pyarrow to be installed')
+
+    table = pa.Table.from_pandas(table_data.reset_index())
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # GET /batteries
+    # GET /stats
+    # GET /batteries/<battery_id>/<table>?file=&columns=a,b&cycle_min=&cycle_max=&start=&stop=&format=json|arrow
+
+    cache = None
+
+    def address_string(self):
+        # unix socket clients have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, data):
+        self.send_body(status, json.dumps(data, default=str).encode('utf-8'), 'application/json')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        try:
+            if parts == ['batteries']:
+                return self.send_json(200, self.cache.battery_ids())
+
+            if parts == ['stats']:
+                return self.send_json(200, self.cache.stats())
+
+            if len(parts) == 3 and parts[0] == 'batteries' and parts[2] in TABLE_NAMES:
+                return self.send_table(parts[1], parts[2], query)
+
+            return self.send_json(404, {'error': f'not found: {url.path}'})
+        except NotFoundError as e:
+            return self.send_json(404, {'error': str(e)})
+        except BadRequestError as e:
+            return self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            # decode or analysis failures are server errors, not missing data
+            self.log_error('error serving %s: %r', self.path, e)
+            return self.send_json(500, {'error': f'{type(e).__name__}: {e}'})
+
+    def send_table(self, battery_id, table_name, query):
+        dataset = self.cache.get(battery_id)
+
+        file_name = query.get('file', list(dataset.ec_data.keys())[-1])
+        if file_name not in dataset.ec_data:
+            raise NotFoundError(f'unknown file: {file_name}')
+        file_data = dataset.ec_data[file_name]
+
+        if table_name == 'meta_data':
+            return self.send_json(200, file_data['meta_data'])
+
+        table_data = file_data.get(table_name)
+        if table_data is None:
+            raise NotFoundError(f'{table_name} not available for {file_name}')
+
+        columns = query['columns'].split(',') if query.get('columns') else None
+        try:
+            cycle_min = float(query['cycle_min']) if 'cycle_min' in query else None
+            cycle_max = float(query['cycle_max']) if 'cycle_max' in query else None
+            start = int(query['start']) if 'start' in query else None
+            stop = int(query['stop']) if 'stop' in query else None
+        except ValueError as e:
+            raise BadRequestError(f'invalid query parameter: {e}')
+        table_data = select_table(table_data, columns, cycle_min, cycle_max, start, stop)
+
+        if query.get('format', 'json') == 'arrow':
+            return self.send_body(200, to_arrow_bytes(table_data), 'application/vnd.apache.arrow.stream')
+
+        body = table_data.reset_index().to_json(orient='records', date_format='iso').encode('utf-8')
+        return self.send_body(200, body, 'application/json')
+
+
+# unix sockets are not available on Windows, there only the TCP server can be used
+if hasattr(socketserver, 'UnixStreamServer'):
+    class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:
+    ThreadingUnixHTTPServer = None
+
+
+def make_server(data_dir, host='127.0.0.1', port=8050, unix_socket=None, max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES, merge=True, rescan_interval_s=DEFAULT_RESCAN_INTERVAL_S):
+    cache = DatasetCache(data_dir, max_memory_bytes, merge, rescan_interval_s)
+    handler = type('BoundQueryHandler', (QueryHandler,), {'cache': cache})
+
+    if unix_socket:
+        if ThreadingUnixHTTPServer is None:
+            raise ValueError('unix sockets are not supported on this platform')
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(data_dir, host='127.0.0.1', port=8050, unix_socket=None, max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES, merge=True, rescan_interval_s=DEFAULT_RESCAN_INTERVAL_S):
+    server = make_server(data_dir, host, port, unix_socket, max_memory_bytes, merge, rescan_interval_s)
+    print(f'serving {data_dir} on {unix_socket if unix_socket else f"http://{host}:{port}"}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve analyzed .nda data from a local long-running process.')
+    parser.add_argument('data_dir')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--unix-socket', default=None)
+    parser.add_argument('--max-memory-mb', type=int, default=DEFAULT_MAX_MEMORY_BYTES // (1024 * 1024))
+    parser.add_argument('--no-merge', action='store_true')
+    parser.add_argument('--rescan-interval-s', type=float, default=DEFAULT_RESCAN_INTERVAL_S)
+    args = parser.parse_args()
+
+    serve(args.data_dir, args.host, args.port, args.unix_socket, args.max_memory_mb * 1024 * 1024, not args.no_merge, args.rescan_interval_s)
@@ -0,0 +1,202 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+
+
+STEP_COLUMNS = [
+    'step_id', 'cycle_id', 'step_name', 'step_method', 'step_time_m',
+    'capacity_chg_Ah', 'capacity_dchg_Ah', 'energy_chg_Wh', 'energy_dchg_Wh',
+    'voltage_i_V', 'voltage_f_V', 'voltage_avg_V', 'current_i_A', 'current_f_A', 'current_avg_A',
+    'timestamp_i', 'timestamp_f', 'voltage_drop_V', 'resistance_ohm',
+]
+
+CYCLE_COLUMNS = [
+    'cycle_id', 'cycle_time_h', 'capacity_chg_Ah', 'capacity_dchg_Ah', 'energy_chg_Wh', 'energy_dchg_Wh',
+    'columbic_eff', 'normalized_dchg', 'specific_chg_mAhg', 'specific_dchg_mAhg',
+]
+
+META_COLUMNS = [
+    'active_mass_g', 'comment', 'creator', 'barcode', 'pn', 'step_file', 'model', 'current_limit',
+    'machine_id', 'row_id', 'channel_id', 'capacity_max_Ah', 'voltage_upper_limit', 'voltage_lower_limit',
+]
+
+# columns change_units may have swapped to milli units, mapped back to the base unit column
+MILLI_COLUMNS = {
+    'capacity_chg_mAh': 'capacity_chg_Ah',
+    'capacity_dchg_mAh': 'capacity_dchg_Ah',
+    'energy_chg_mWh': 'energy_chg_Wh',
+    'energy_dchg_mWh': 'energy_dchg_Wh',
+    'current_i_mA': 'current_i_A',
+    'current_f_mA': 'current_f_A',
+    'current_avg_mA': 'current_avg_A',
+    'resistance_mohm': 'resistance_ohm',
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS batteries (
+    battery_id TEXT PRIMARY KEY,
+    group_name TEXT,
+    test_plan TEXT,
+    active_mass_g REAL,
+    primary_file TEXT
+);
+CREATE INDEX IF NOT EXISTS batteries_group ON batteries (group_name);
+
+CREATE TABLE IF NOT EXISTS meta_data (
+    battery_id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    active_mass_g REAL, comment TEXT, creator TEXT, barcode TEXT, pn INTEGER, step_file TEXT, model INTEGER,
+    current_limit INTEGER, machine_id INTEGER, row_id INTEGER, channel_id INTEGER,
+    capacity_max_Ah REAL, voltage_upper_limit REAL, voltage_lower_limit REAL,
+    PRIMARY KEY (battery_id, file_name)
+);
+
+CREATE TABLE IF NOT EXISTS step_data (
+    battery_id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    step_id INTEGER NOT NULL,
+    cycle_id INTEGER,
+    step_name TEXT, step_method INTEGER, step_time_m REAL,
+    capacity_chg_Ah REAL, capacity_dchg_Ah REAL, energy_chg_Wh REAL, energy_dchg_Wh REAL,
+    voltage_i_V REAL, voltage_f_V REAL, voltage_avg_V REAL, current_i_A REAL, current_f_A REAL, current_avg_A REAL,
+    timestamp_i TEXT, timestamp_f TEXT, voltage_drop_V REAL, resistance_ohm REAL,
+    PRIMARY KEY (battery_id, file_name, step_id)
+);
+CREATE INDEX IF NOT EXISTS step_data_cycle ON step_data (battery_id, cycle_id);
+
+CREATE TABLE IF NOT EXISTS cycle_data (
+    battery_id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    cycle_id INTEGER NOT NULL,
+    cycle_time_h REAL, capacity_chg_Ah REAL, capacity_dchg_Ah REAL, energy_chg_Wh REAL, energy_dchg_Wh REAL,
+    columbic_eff REAL, normalized_dchg REAL, specific_chg_mAhg REAL, specific_dchg_mAhg REAL,
+    PRIMARY KEY (battery_id, file_name, cycle_id)
+);
+CREATE INDEX IF NOT EXISTS cycle_data_cycle ON cycle_data (cycle_id);
+'''
+
+
+def to_sql_value(value):
+    # sqlite3 stores numpy scalars as BLOBs and cannot bind Timestamps, so hand it plain Python values
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return str(value)
+    return value
+
+
+def to_base_units(table_data):
+    for milli_column, base_column in MILLI_COLUMNS.items():
+        if milli_column in table_data.columns and base_column not in table_data.columns:
+            table_data[base_column] = table_data[milli_column] / 1000
+    return table_data
+
+
+def prepare_table(table_data, columns, index_name):
+    table_data = table_data.copy()
+    if table_data.index.name == index_name and index_name not in table_data.columns:
+        table_data = table_data.reset_index()
+    else:
+        table_data = table_data.reset_index(drop=True)
+
+    table_data = to_base_units(table_data)
+    return table_data.reindex(columns=columns)
+
+
+def table_rows(table_data, battery_id, file_name):
+    return [[battery_id, file_name] + [to_sql_value(value) for value in row] for row in table_data.itertuples(index=False)]
+
+
+class SummaryStore:
+    # Persistent SQLite store of per-battery step_data, cycle_data and meta_data.
+    # Each upsert replaces everything stored for that battery, so re-running bulk_load keeps it current.
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+
+    def upsert_battery(self, battery_id, battery_data, group_name=None, test_plan=None, active_mass_g=None):
+        # battery_data is a Dataset's ec_data / ec_data_display, i.e. one value of the bulk_load result.
+        # cycle_id restarts at 1 in every .nda file, so only merged_data (or a battery's only file) has
+        # battery-wide cycle ids. Unmerged multi-file batteries get no primary file and are left out of
+        # cross-battery queries such as retention_by_group; their per-file rows are still stored.
+        file_names = list(battery_data.keys())
+        if 'merged_data' in file_names:
+            primary_file = 'merged_data'
+        elif len(file_names) == 1:
+            primary_file = file_names[0]
+        else:
+            primary_file = None
+            print(f'{battery_id}: {len(file_names)} files without merged_data, excluded from retention_by_group')
+        battery_row = [to_sql_value(value) for value in [battery_id, group_name, test_plan, active_mass_g, primary_file]]
+
+        # build every row first, then replace the battery's rows in a single transaction
+        rows = {'meta_data': [], 'step_data': [], 'cycle_data': []}
+        for file_name, file_data in battery_data.items():
+            meta_data = pd.DataFrame([{column: file_data['meta_data'].get(column) for column in META_COLUMNS}], columns=META_COLUMNS)
+            rows['meta_data'] += table_rows(meta_data, battery_id, file_name)
+
+            if file_data.get('step_data') is not None:
+                rows['step_data'] += table_rows(prepare_table(file_data['step_data'], STEP_COLUMNS, 'step_id'), battery_id, file_name)
+
+            if file_data.get('cycle_data') is not None:
+                rows['cycle_data'] += table_rows(prepare_table(file_data['cycle_data'], CYCLE_COLUMNS, 'cycle_id'), battery_id, file_name)
+
+        table_columns = {'meta_data': META_COLUMNS, 'step_data': STEP_COLUMNS, 'cycle_data': CYCLE_COLUMNS}
+        with self.conn:
+            for table_name in ['meta_data', 'step_data', 'cycle_data']:
+                self.conn.execute(f'DELETE FROM {table_name} WHERE battery_id = ?', (battery_id,))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO batteries (battery_id, group_name, test_plan, active_mass_g, primary_file) VALUES (?, ?, ?, ?, ?)',
+                battery_row,
+            )
+
+            for table_name, columns in table_columns.items():
+                columns = ['battery_id', 'file_name'] + columns
+                self.conn.executemany(
+                    f'INSERT INTO {table_name} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                    rows[table_name],
+                )
+
+        return
+
+    def upsert_bulk(self, all_data, battery_df):
+        for battery_id, battery_data in all_data.items():
+            self.upsert_battery(
+                battery_id,
+                battery_data,
+                group_name=battery_df.loc[battery_id, 'Group Name'],
+                test_plan=battery_df.loc[battery_id, 'Test Plan'],
+                active_mass_g=battery_df.loc[battery_id, 'Active Mass (g)'],
+            )
+        return
+
+    def query(self, sql, params=()):
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def retention_by_group(self, cycle_id, column='normalized_dchg'):
+        # e.g. capacity retention at cycle 500 by group, using each battery's primary file (merged_data or its
+        # only file); unmerged multi-file batteries are skipped because their cycle ids restart per file
+        if column not in CYCLE_COLUMNS:
+            raise KeyError(f'unknown cycle_data column: {column}')
+
+        return self.query(f'''
+            SELECT b.group_name, COUNT(*) AS cells, AVG(c.{column}) AS mean, MIN(c.{column}) AS min, MAX(c.{column}) AS max
+            FROM cycle_data c
+            JOIN batteries b ON b.battery_id = c.battery_id AND b.primary_file = c.file_name
+            WHERE c.cycle_id = ?
+            GROUP BY b.group_name
+            ORDER BY b.group_name
+        ''', (int(cycle_id),))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from .. import fade
+from ..fade import FadeFitter, cycles_to_threshold, fit_fade, pack_cycle_series
+
+
+def exact_series():
+    cycles = np.arange(1, 51, dtype=float)
+    values = np.vstack([
+        1.0 - 0.01 * cycles,
+        1.0 - 0.05 * np.sqrt(cycles),
+        1.0 - 0.002 * cycles ** 1.5,
+    ])
+    return ['linear', 'sqrt', 'power'], np.tile(cycles, (3, 1)), values
+
+
+def make_all_data(series_by_battery, file_name='cell.nda'):
+    all_data = {}
+    for battery_id, values in series_by_battery.items():
+        cycle_data = pd.DataFrame({'cycle_id': np.arange(1, len(values) + 1), 'normalized_dchg': values}).set_index('cycle_id')
+        all_data[battery_id] = {file_name: {'meta_data': {}, 'cycle_data': cycle_data}}
+    return all_data
+
+
+def test_exact_models_recover_parameters_and_eol():
+    battery_ids, cycles, values = exact_series()
+    results = FadeFitter().update(battery_ids, cycles, values).results()
+
+    assert np.isclose(results.loc['linear', 'linear_a'], 1.0)
+    assert np.isclose(results.loc['linear', 'linear_b'], -0.01)
+    assert np.isclose(results.loc['linear', 'linear_r2'], 1.0)
+    assert np.isclose(results.loc['linear', 'linear_eol_cycles'], 20.0)
+
+    assert np.isclose(results.loc['sqrt', 'sqrt_a'], 1.0)
+    assert np.isclose(results.loc['sqrt', 'sqrt_b'], -0.05)
+    assert np.isclose(results.loc['sqrt', 'sqrt_eol_cycles'], 16.0)
+
+    assert np.isclose(np.exp(results.loc['power', 'power_a']), 0.002)
+    assert np.isclose(results.loc['power', 'power_b'], 1.5)
+    assert np.isclose(results.loc['power', 'power_r2_log'], 1.0)
+    assert np.isclose(results.loc['power', 'power_eol_cycles'], 100 ** (2 / 3))
+
+    assert results.loc['linear', 'best_model'] == 'linear'
+    assert results.loc['sqrt', 'best_model'] == 'sqrt'
+    assert 'power_r2' not in results.columns
+
+
+def test_eol_is_nan_when_threshold_crossed_before_cycle_zero():
+    a = np.array([0.7, 0.7])
+    b = np.array([-0.01, -0.01])
+    assert np.isnan(cycles_to_threshold('linear', a, b, 0.8)).all()
+    assert np.isnan(cycles_to_threshold('sqrt', a, b, 0.8)).all()
+
+
+def test_update_split_across_calls_matches_single_fit():
+    battery_ids, cycles, values = exact_series()
+    values = values + np.sin(cycles) * 0.001
+    expected = FadeFitter().update(battery_ids, cycles, values).results()
+
+    fitter = FadeFitter()
+    fitter.update(battery_ids, np.where(cycles <= 20, cycles, np.nan), values)
+    results = fitter.update(battery_ids, cycles, values).results()
+
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_partial_trailing_cycle_is_replaced():
+    cycles = np.arange(1, 11, dtype=float)
+    values = 1.0 - 0.01 * cycles
+    partial = values.copy()
+    partial[-1] = 0.3
+
+    fitter = FadeFitter(models=['linear'])
+    fitter.update(['A'], cycles[None, :], partial[None, :])
+    assert fitter.results(include_trailing=True).loc['A', 'linear_r2'] < 0.5
+
+    fitter.update(['A'], cycles[None, :], values[None, :])
+    results = fitter.results(include_trailing=True)
+    assert np.isclose(results.loc['A', 'linear_r2'], 1.0)
+    assert np.isclose(results.loc['A', 'linear_eol_cycles'], 20.0)
+    assert results.loc['A', 'linear_n'] == 10
+    assert fitter.results().loc['A', 'linear_n'] == 9
+
+
+def test_new_source_file_refits_cell():
+    fitter = FadeFitter(models=['linear'])
+    fitter.update_from_bulk(make_all_data({'A': 1.0 - 0.01 * np.arange(1, 31)}, file_name='cell.nda'))
+
+    # an unmerged battery switches to its newest file, where cycle ids restart at 1
+    new_values = 0.9 - 0.02 * np.arange(1, 11)
+    results = fitter.update_from_bulk(make_all_data({'A': new_values}, file_name='cell_2.nda')).results()
+
+    assert results.loc['A', 'linear_n'] == 9
+    assert np.isclose(results.loc['A', 'linear_a'], 0.9)
+    assert np.isclose(results.loc['A', 'linear_b'], -0.02)
+
+
+def test_fit_fade_from_bulk_output():
+    all_data = make_all_data({'A': 1.0 - 0.01 * np.arange(1, 31), 'B': 1.0 - 0.02 * np.arange(1, 11)})
+    battery_ids, cycles, values, sources = pack_cycle_series(all_data)
+    assert battery_ids == ['A', 'B']
+    assert cycles.shape == (2, 30)
+    assert np.isnan(cycles[1, 10:]).all()
+    assert sources == ['cell.nda', 'cell.nda']
+
+    results = fit_fade(all_data)
+    assert np.allclose(results['linear_eol_cycles'], [20.0, 10.0])
+
+
+def test_fit_fade_ignores_partial_last_cycle():
+    values = np.append(1.0 - 0.001 * np.arange(1, 201), 0.0)
+    results = fit_fade(make_all_data({'A': values}))
+
+    assert results.loc['A', 'linear_n'] == 200
+    assert np.isclose(results.loc['A', 'linear_r2'], 1.0)
+    assert np.isclose(results.loc['A', 'linear_eol_cycles'], 200.0)
+    assert results.loc['A', 'last_cycle'] == 201
+
+
+def test_appended_only_cycles_are_accepted(monkeypatch):
+    cycles = np.arange(1, 21, dtype=float)[None, :]
+    values = 1.0 - 0.01 * cycles + np.sin(cycles) * 0.001
+    expected = FadeFitter().update(['A'], cycles, values)
+
+    widths = []
+    original = fade.series_stats
+
+    def recording_series_stats(model, cycles, values):
+        widths.append(cycles.shape[1])
+        return original(model, cycles, values)
+
+    monkeypatch.setattr(fade, 'series_stats', recording_series_stats)
+
+    fitter = FadeFitter()
+    fitter.update(['A'], cycles[:, :10], values[:, :10])
+    widths.clear()
+    fitter.update(['A'], cycles[:, 10:], values[:, 10:])
+    assert max(widths) == 10
+
+    for include_trailing in [False, True]:
+        pd.testing.assert_frame_equal(fitter.results(include_trailing), expected.results(include_trailing))
+    assert fitter.results(include_trailing=True).loc['A', 'linear_n'] == 20
+
+    # passing the full history again only transforms the columns after the committed cycles
+    widths.clear()
+    longer_cycles = np.arange(1, 23, dtype=float)[None, :]
+    longer_values = 1.0 - 0.01 * longer_cycles
+    fitter.update(['A'], longer_cycles, longer_values)
+    assert max(widths) == 3
+    assert fitter.results().loc['A', 'linear_n'] == 21
@@ -0,0 +1,104 @@
+import os
+
+import pandas as pd
+
+from .. import prefetch
+from ..prefetch import FilePrefetcher
+from ..read_nda import read_file
+from .test_store import write_nda
+
+
+def write_files(tmp_path, sizes):
+    paths = []
+    for i, size in enumerate(sizes):
+        path = str(tmp_path / f'file_{i}.bin')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def count_reads(monkeypatch):
+    calls = []
+    original = prefetch.read_chunk
+
+    def counting_read_chunk(inpath, offset, length):
+        calls.append((inpath, offset))
+        return original(inpath, offset, length)
+
+    monkeypatch.setattr(prefetch, 'read_chunk', counting_read_chunk)
+    return calls
+
+
+def test_multi_chunk_files_are_reassembled(tmp_path, monkeypatch):
+    calls = count_reads(monkeypatch)
+    paths = write_files(tmp_path, [0, 10, 64, 65, 1000])
+
+    with FilePrefetcher(paths, chunk_bytes=64) as prefetcher:
+        for path, file_bytes in prefetcher:
+            assert file_bytes == read_bytes(path)
+
+    assert sum(1 for path, offset in calls if path == paths[-1]) == 16
+
+
+def test_missing_file_raises_from_its_own_get(tmp_path):
+    paths = write_files(tmp_path, [100, 100])
+    missing = str(tmp_path / 'missing.bin')
+
+    with FilePrefetcher([paths[0], missing, paths[1]], chunk_bytes=64) as prefetcher:
+        assert prefetcher.get(paths[0]) == read_bytes(paths[0])
+        try:
+            prefetcher.get(missing)
+        except FileNotFoundError as e:
+            assert e.filename == missing
+        else:
+            raise AssertionError('expected FileNotFoundError')
+        assert prefetcher.get(paths[1]) == read_bytes(paths[1])
+
+
+def test_duplicate_paths_are_read_once(tmp_path, monkeypatch):
+    calls = count_reads(monkeypatch)
+    paths = write_files(tmp_path, [100, 100])
+
+    with FilePrefetcher([paths[0], paths[1], paths[0]], readahead_bytes=150) as prefetcher:
+        assert prefetcher.file_paths == paths
+        for path in paths:
+            assert prefetcher.get(path) == read_bytes(path)
+        assert prefetcher._queued_bytes == 0
+
+    assert sorted(path for path, offset in calls) == sorted(paths)
+
+
+def test_readahead_budget_limits_scheduled_files(tmp_path):
+    paths = write_files(tmp_path, [100, 100, 100, 500, 100])
+
+    with FilePrefetcher(paths, readahead_bytes=250) as prefetcher:
+        assert list(prefetcher._pending) == paths[:2]
+
+        prefetcher.get(paths[0])
+        assert list(prefetcher._pending) == paths[1:3]
+
+        # a file larger than the budget is still scheduled once nothing else is pending
+        prefetcher.get(paths[1])
+        prefetcher.get(paths[2])
+        assert list(prefetcher._pending) == paths[3:4]
+        prefetcher.get(paths[3])
+        assert list(prefetcher._pending) == paths[4:]
+
+
+def test_read_file_with_prefetched_bytes_matches_direct_read(tmp_path):
+    path = str(tmp_path / 'TMC19A1H001RC4.nda')
+    write_nda(path, n_cycles=3)
+
+    direct = read_file(path)
+    with FilePrefetcher([path], chunk_bytes=256) as prefetcher:
+        prefetched = read_file(path, file_bytes=prefetcher.get(path))
+
+    assert direct['meta_data'] == prefetched['meta_data']
+    pd.testing.assert_frame_equal(direct['raw_data'], prefetched['raw_data'])
+    assert direct['auxt_data'] is None and prefetched['auxt_data'] is None
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from .. import server
+from ..server import DatasetCache, make_server
+from .test_store import write_nda
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for battery_id in ['TMC19A1H001', 'TMC19A1H002', 'TMC19A1H003']:
+        write_nda(data_dir / f'{battery_id}RC4.nda', n_cycles=3)
+    return data_dir
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    counts = {'loads': [], 'scans': 0}
+    original_load = DatasetCache._load
+    original_find = server.find_battery_files
+
+    def counting_load(self, file_paths):
+        counts['loads'].append(sorted(os.path.basename(file_path) for file_path in file_paths))
+        time.sleep(0.05)
+        return original_load(self, file_paths)
+
+    def counting_find(data_dir):
+        counts['scans'] += 1
+        return original_find(data_dir)
+
+    monkeypatch.setattr(DatasetCache, '_load', counting_load)
+    monkeypatch.setattr(server, 'find_battery_files', counting_find)
+    return counts
+
+
+def start_server(data_dir, **kwargs):
+    query_server = make_server(str(data_dir), port=0, **kwargs)
+    threading.Thread(target=query_server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{query_server.server_address[1]}'
+
+    def get(path):
+        with urllib.request.urlopen(base_url + path) as response:
+            return json.loads(response.read())
+
+    return query_server, get
+
+
+def get_status(get, path):
+    try:
+        get(path)
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())['error']
+    return 200, None
+
+
+def test_cache_hits_do_not_rescan_or_reload(data_dir, counters):
+    query_server, get = start_server(data_dir)
+    try:
+        for i in range(5):
+            cycle_data = get('/batteries/TMC19A1H001/cycle_data?columns=capacity_dchg_Ah&cycle_min=1&cycle_max=2')
+        assert [row['cycle_id'] for row in cycle_data] == [1, 2]
+        assert len(counters['loads']) == 1
+        assert counters['scans'] == 1
+    finally:
+        query_server.shutdown()
+        query_server.server_close()
+
+
+def test_lru_eviction_under_memory_cap(data_dir, counters):
+    query_server, get = start_server(data_dir)
+    try:
+        get('/batteries/TMC19A1H001/meta_data')
+        battery_bytes = get('/stats')['memory_bytes']
+    finally:
+        query_server.shutdown()
+        query_server.server_close()
+
+    # room for two batteries, not three
+    query_server, get = start_server(data_dir, max_memory_bytes=int(battery_bytes * 2.5))
+    try:
+        get('/batteries/TMC19A1H001/meta_data')
+        get('/batteries/TMC19A1H002/meta_data')
+        get('/batteries/TMC19A1H001/meta_data')
+        get('/batteries/TMC19A1H003/meta_data')
+
+        stats = get('/stats')
+        assert list(stats['batteries']) == ['TMC19A1H001', 'TMC19A1H003']
+        assert stats['memory_bytes'] <= stats['max_memory_bytes']
+    finally:
+        query_server.shutdown()
+        query_server.server_close()
+
+
+def test_reload_after_touch_and_new_file(data_dir, counters):
+    query_server, get = start_server(data_dir, rescan_interval_s=0)
+    try:
+        get('/batteries/TMC19A1H001/cycle_data')
+        get('/batteries/TMC19A1H001/cycle_data')
+        assert len(counters['loads']) == 1
+
+        file_path = data_dir / 'TMC19A1H001RC4.nda'
+        mtime = os.path.getmtime(file_path) + 10
+        os.utime(file_path, (mtime, mtime))
+        get('/batteries/TMC19A1H001/cycle_data')
+        assert len(counters['loads']) == 2
+
+        write_nda(data_dir / 'TMC19A1H001RC5.nda', n_cycles=2)
+        get('/batteries/TMC19A1H001/cycle_data')
+        assert counters['loads'][-1] == ['TMC19A1H001RC4.nda', 'TMC19A1H001RC5.nda']
+    finally:
+        query_server.shutdown()
+        query_server.server_close()
+
+
+def test_concurrent_requests_share_one_load(data_dir, counters):
+    query_server, get = start_server(data_dir)
+    try:
+        threads = [threading.Thread(target=get, args=(f'/batteries/TMC19A1H002/{table_name}',))
+                   for table_name in ['raw_data', 'step_data', 'cycle_data', 'meta_data']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(counters['loads']) == 1
+    finally:
+        query_server.shutdown()
+        query_server.server_close()
+
+
+def test_error_statuses(data_dir):
+    # an unsupported current limit fails while decoding, which is a server error rather than a missing battery
+    broken_path = data_dir / 'TMC19A1H009RC4.nda'
+    write_nda(broken_path, n_cycles=2)
+    file_bytes = bytearray(broken_path.read_bytes())
+    file_bytes[2074:2078] = (1234).to_bytes(4, 'little', signed=True)
+    broken_path.write_bytes(bytes(file_bytes))
+
+    query_server, get = start_server(data_dir)
+    try:
+        assert get_status(get, '/batteries/TMC19A1H404/step_data')[0] == 404
+        assert get_status(get, '/batteries/TMC19A1H001/step_data?file=other.nda')[0] == 404
+        assert get_status(get, '/batteries/TMC19A1H001/step_data?columns=not_a_column')[0] == 404
+        assert get_status(get, '/batteries/TMC19A1H001/not_a_table')[0] == 404
+        assert get_status(get, '/batteries/TMC19A1H001/step_data?start=abc')[0] == 400
+
+        status, error = get_status(get, '/batteries/TMC19A1H009/step_data')
+        assert status == 500
+        assert error.startswith('KeyError')
+    finally:
+        query_server.shutdown()
+        query_server.server_close()
@@ -0,0 +1,192 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from ..analysis import bulk_load
+from ..read_nda import process_body_bytes
+from ..store import SummaryStore
+
+
+def make_battery_data(capacity_dchg_Ah, rated_capacity_Ah=1.0):
+    cycle_ids = np.arange(1, len(capacity_dchg_Ah) + 1)
+    cycle_data = pd.DataFrame({
+        'cycle_id': cycle_ids,
+        'cycle_time_h': np.full(len(cycle_ids), 2.0),
+        'capacity_chg_Ah': np.full(len(cycle_ids), rated_capacity_Ah),
+        'capacity_dchg_Ah': capacity_dchg_Ah,
+        'energy_chg_Wh': np.full(len(cycle_ids), 3.7),
+        'energy_dchg_Wh': np.full(len(cycle_ids), 3.5),
+    })
+    cycle_data['columbic_eff'] = cycle_data['capacity_dchg_Ah'] / cycle_data['capacity_chg_Ah']
+    cycle_data['normalized_dchg'] = cycle_data['capacity_dchg_Ah'] / rated_capacity_Ah
+    cycle_data.set_index(['cycle_id'], inplace=True)
+
+    step_data = pd.DataFrame({
+        'step_id': np.arange(1, len(cycle_ids) + 1),
+        'cycle_id': cycle_ids,
+        'step_name': 'CC_Dchg',
+        'capacity_dchg_Ah': capacity_dchg_Ah,
+        'current_i_A': np.full(len(cycle_ids), -0.5),
+        'resistance_ohm': np.full(len(cycle_ids), 0.05),
+        'timestamp_i': pd.date_range('2024-01-01', periods=len(cycle_ids), freq='h'),
+    })
+    step_data.set_index(['step_id'], inplace=True)
+
+    meta_data = {'active_mass_g': 1.5, 'current_limit': np.int64(6000), 'capacity_max_Ah': np.float64(rated_capacity_Ah)}
+    return {'cell.nda': {'meta_data': meta_data, 'step_data': step_data, 'cycle_data': cycle_data}}
+
+
+def to_milli_units(battery_data):
+    # same column swap as Dataset.change_units(convert_to_mA=True)
+    file_data = battery_data['cell.nda']
+    cycle_data = file_data['cycle_data']
+    for column in ['capacity_chg', 'capacity_dchg']:
+        cycle_data[f'{column}_mAh'] = cycle_data[f'{column}_Ah'] * 1000
+    cycle_data = cycle_data.drop(['capacity_chg_Ah', 'capacity_dchg_Ah'], axis=1)
+
+    step_data = file_data['step_data']
+    step_data['capacity_dchg_mAh'] = step_data['capacity_dchg_Ah'] * 1000
+    step_data['current_i_mA'] = step_data['current_i_A'] * 1000
+    step_data['resistance_mohm'] = step_data['resistance_ohm'] * 1000
+    step_data = step_data.drop(['capacity_dchg_Ah', 'current_i_A', 'resistance_ohm'], axis=1)
+
+    return {'cell.nda': {'meta_data': file_data['meta_data'], 'step_data': step_data, 'cycle_data': cycle_data}}
+
+
+def write_nda(path, n_cycles, day=1):
+    body_dtype = process_body_bytes(b'').dtype
+    header = bytearray(2600)
+    header[152:156] = (1500000).to_bytes(4, 'little')
+    header[2074:2078] = (6000).to_bytes(4, 'little', signed=True)
+
+    records = np.zeros(n_cycles * 2 * 5, body_dtype)
+    records['aux_indicator'] = 85
+    records['record_raw'] = np.arange(len(records)) + 1
+    records['current_range'] = 100
+    records['year'], records['month'], records['day'] = 2024, 1, day
+    records['hour'] = np.arange(len(records)) // 60
+    records['minute'] = np.arange(len(records)) % 60
+    records['voltage'] = 37000
+    for i in range(n_cycles * 2):
+        step = records[i * 5:(i + 1) * 5]
+        is_dchg = i % 2 == 1
+        step['step_method'] = 2 if is_dchg else 1
+        step['step_name_raw'] = 2 if is_dchg else 1
+        step['step_time'] = np.arange(5) * 1000
+        step['current'] = -100000 if is_dchg else 100000
+        capacity = np.linspace(0, 1.0 - 0.01 * (i // 2), 5) * 100000 * 3600
+        step['capacity_dchg' if is_dchg else 'capacity_chg'] = capacity.astype(np.int64)
+
+    with open(path, 'wb') as f:
+        f.write(bytes(header) + records.tobytes())
+
+
+def test_upsert_replaces_battery_rows(tmp_path):
+    with SummaryStore(str(tmp_path / 'summary.db')) as store:
+        store.upsert_battery('A1', make_battery_data([1.0, 0.9, 0.8]), group_name='g1', test_plan='plan')
+        store.upsert_battery('A1', make_battery_data([1.0, 0.95]), group_name='g1', test_plan='plan')
+        store.upsert_battery('B1', make_battery_data([1.0, 0.85, 0.7]), group_name='g1', test_plan='plan')
+
+        counts = store.query('SELECT battery_id, COUNT(*) AS n FROM cycle_data GROUP BY battery_id ORDER BY battery_id')
+        assert counts['n'].tolist() == [2, 3]
+        assert store.query("SELECT COUNT(*) AS n FROM step_data WHERE battery_id = 'A1'")['n'][0] == 2
+        assert store.query("SELECT COUNT(*) AS n FROM meta_data WHERE battery_id = 'A1'")['n'][0] == 1
+        assert store.query("SELECT timestamp_i FROM step_data WHERE battery_id = 'A1' AND step_id = 2")['timestamp_i'][0] == '2024-01-01 01:00:00'
+
+        retention = store.retention_by_group(2)
+        assert retention['group_name'].tolist() == ['g1']
+        assert retention['cells'][0] == 2
+        assert np.isclose(retention['mean'][0], (0.95 + 0.85) / 2)
+
+
+def test_upsert_is_atomic(tmp_path):
+    with SummaryStore(str(tmp_path / 'summary.db')) as store:
+        store.upsert_battery('A1', make_battery_data([1.0, 0.9, 0.8]), group_name='g1')
+
+        # duplicate cycle ids violate the primary key while inserting cycle_data
+        broken = make_battery_data([1.0, 0.9])
+        broken['cell.nda']['cycle_data'].index = pd.Index([1, 1], name='cycle_id')
+        try:
+            store.upsert_battery('A1', broken, group_name='g1')
+        except sqlite3.IntegrityError:
+            pass
+        else:
+            raise AssertionError('expected an IntegrityError')
+
+        assert store.query("SELECT COUNT(*) AS n FROM cycle_data WHERE battery_id = 'A1'")['n'][0] == 3
+        assert store.query("SELECT COUNT(*) AS n FROM step_data WHERE battery_id = 'A1'")['n'][0] == 3
+
+
+def test_numpy_group_name_is_stored_as_value(tmp_path):
+    battery_df = pd.DataFrame({'Active Mass (g)': [1.5, 1.5], 'Group Name': [1, 2], 'Test Plan': ['p', np.nan]}, index=['A1', 'B1'])
+    with SummaryStore(str(tmp_path / 'summary.db')) as store:
+        store.upsert_bulk({'A1': make_battery_data([1.0, 0.9]), 'B1': make_battery_data([1.0, 0.8])}, battery_df)
+
+        batteries = store.query('SELECT battery_id, typeof(group_name) AS group_type, group_name, test_plan FROM batteries ORDER BY battery_id')
+        assert batteries['group_type'].tolist() == ['text', 'text']
+        assert batteries['group_name'].tolist() == ['1', '2']
+        assert batteries['test_plan'].isna().tolist() == [False, True]
+        assert store.retention_by_group(2)['mean'].round(6).tolist() == [0.9, 0.8]
+
+
+def test_milli_units_are_restored_to_base_units(tmp_path):
+    with SummaryStore(str(tmp_path / 'summary.db')) as store:
+        store.upsert_battery('A1', to_milli_units(make_battery_data([1.0, 0.9])))
+
+        cycle_data = store.query("SELECT capacity_chg_Ah, capacity_dchg_Ah FROM cycle_data WHERE battery_id = 'A1' ORDER BY cycle_id")
+        assert np.allclose(cycle_data['capacity_dchg_Ah'], [1.0, 0.9])
+        assert np.allclose(cycle_data['capacity_chg_Ah'], [1.0, 1.0])
+
+        step_data = store.query("SELECT capacity_dchg_Ah, current_i_A, resistance_ohm FROM step_data WHERE battery_id = 'A1' ORDER BY step_id")
+        assert np.allclose(step_data['capacity_dchg_Ah'], [1.0, 0.9])
+        assert np.allclose(step_data['current_i_A'], [-0.5, -0.5])
+        assert np.allclose(step_data['resistance_ohm'], [0.05, 0.05])
+
+
+def test_bulk_load_upserts_into_store(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    write_nda(data_dir / 'TMC19A1H001RC4.nda', n_cycles=3)
+    write_nda(data_dir / 'TMC19A1H002RC4.nda', n_cycles=4)
+    battery_df = pd.DataFrame({'Active Mass (g)': [1.5, 1.5], 'Group Name': ['A', 'B'], 'Test Plan': ['p', 'p']}, index=['TMC19A1H001', 'TMC19A1H002'])
+
+    with SummaryStore(str(tmp_path / 'summary.db')) as store:
+        all_data = bulk_load(str(data_dir), battery_df, change_units=True, store=store)
+
+        assert sorted(all_data.keys()) == ['TMC19A1H001', 'TMC19A1H002']
+        batteries = store.query('SELECT battery_id, group_name FROM batteries ORDER BY battery_id')
+        assert batteries['group_name'].tolist() == ['A', 'B']
+
+        cycle_data = store.query("SELECT cycle_id, capacity_dchg_Ah FROM cycle_data WHERE battery_id = 'TMC19A1H002' ORDER BY cycle_id")
+        assert np.allclose(cycle_data['capacity_dchg_Ah'].iloc[:3], [1.0, 0.99, 0.98])
+
+
+def test_retention_uses_battery_wide_cycle_ids_only(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    # two files for one battery: the second starts a day later and its cycle ids restart at 1
+    write_nda(data_dir / 'TMC19A1H001RC4.nda', n_cycles=3)
+    write_nda(data_dir / 'TMC19A1H001RC5.nda', n_cycles=4, day=2)
+    write_nda(data_dir / 'TMC19A1H002RC4.nda', n_cycles=5)
+    battery_df = pd.DataFrame({'Active Mass (g)': [1.5, 1.5], 'Group Name': ['A', 'B'], 'Test Plan': ['p', 'p']}, index=['TMC19A1H001', 'TMC19A1H002'])
+
+    with SummaryStore(str(tmp_path / 'unmerged.db')) as store:
+        bulk_load(str(data_dir), battery_df, merge=False, store=store)
+
+        batteries = store.query('SELECT battery_id, primary_file FROM batteries ORDER BY battery_id')
+        assert batteries['primary_file'].isna().tolist() == [True, False]
+        assert store.query("SELECT COUNT(DISTINCT file_name) AS n FROM cycle_data WHERE battery_id = 'TMC19A1H001'")['n'][0] == 2
+        assert store.retention_by_group(4)['group_name'].tolist() == ['B']
+
+    with SummaryStore(str(tmp_path / 'merged.db')) as store:
+        bulk_load(str(data_dir), battery_df, merge=True, store=store)
+
+        assert store.query("SELECT primary_file FROM batteries WHERE battery_id = 'TMC19A1H001'")['primary_file'][0] == 'merged_data'
+        cycle_ids = store.query("SELECT cycle_id FROM cycle_data WHERE battery_id = 'TMC19A1H001' AND file_name = 'merged_data' ORDER BY cycle_id")
+        assert cycle_ids['cycle_id'].max() >= 7
+
+        retention = store.retention_by_group(4)
+        assert retention['group_name'].tolist() == ['A', 'B']
+        # battery-wide cycle 4 is the first cycle of the second file
+        assert np.isclose(retention['mean'][0], 1.0)